@@ -15,11 +15,17 @@ setup(
         "jsonref",
         "argparse",
         "openai",
+        "PyMuPDF>=1.24.3",
         "PyPDF2",
         "requests",
         "beautifulsoup4",
+        "lxml",
+        "selectolax>=0.3.21",
         "python-dotenv",
         "tiktoken",
+        "orjson",
+        "ijson",
+        "tqdm>=4.61",
     ],
     entry_points={
         "console_scripts": [
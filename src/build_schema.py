@@ -1,21 +1,53 @@
+import hashlib
 import json
 import yaml
 import logging
 import os
+import pathlib
 import sys
-import copy
 from jsonschema import Draft7Validator
-from typing import Any, Dict, List, Union, Optional
+from typing import Any, Dict, Iterator, List, Set, Tuple, Union, Optional
+
+# Prefer the libyaml-backed loader when PyYAML was built against it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# orjson parses and serializes in C; fall back to the stdlib when it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Constants
 SCHEMA_FILE = 'schema.json'
 CONFIG_FILE = 'instructions.yaml'
+SCALAR_TYPES = ('string', 'number', 'integer', 'boolean', 'null')
 
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+DATA_DIR = pathlib.Path(__file__).resolve().parents[1] / 'data'
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+# Digests of schema files that already passed the Draft 7 metaschema check
+_checked_schemas: Set[bytes] = set()
+
+
+def _json_loads(data: bytes) -> Any:
+    """Parse JSON from UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    # Decode explicitly; json.loads would otherwise sniff the encoding first
+    return json.loads(data.decode('utf-8'))
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize an object to UTF-8 JSON bytes indented by two spaces."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
 
 def load_schema(filename: str) -> Dict[str, Any]:
     """
@@ -32,15 +64,19 @@ def load_schema(filename: str) -> Dict[str, Any]:
     """
     logging.info(f"Loading JSON Schema from '{filename}'...")
     try:
-        with open(os.path.join(DATA_DIR, filename), 'r') as f:
-            schema = json.load(f)
-        # Validate that it is well-formed JSON Schema
-        try:
-            Draft7Validator.check_schema(schema)
-            logging.info("JSON Schema is valid.")
-        except Exception as e:
-            logging.error(f"Invalid JSON Schema: {e}")
-            sys.exit(1)
+        with open(DATA_DIR / filename, 'rb') as f:
+            data = f.read()
+        schema = _json_loads(data)
+        # Validate that it is well-formed JSON Schema, once per distinct file content
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if digest not in _checked_schemas:
+            try:
+                Draft7Validator.check_schema(schema)
+                logging.info("JSON Schema is valid.")
+            except Exception as e:
+                logging.error(f"Invalid JSON Schema: {e}")
+                sys.exit(1)
+            _checked_schemas.add(digest)
         return schema
     except FileNotFoundError:
         logging.error(f"File '{filename}' not found.")
@@ -62,46 +98,78 @@ def resolve_references(schema: Dict[str, Any]) -> Dict[str, Any]:
     """
     logging.info("Resolving $ref references...")
     definitions = schema.get('$defs', {})
-    return _resolve_refs(schema, definitions)
+    return _RefResolver(definitions).resolve(schema)
 
 
-def _resolve_refs(node: Any, definitions: Dict[str, Any]) -> Any:
+class _RefResolver:
     """
-    Helper function to recursively resolve $ref references in the schema.
+    Resolve $ref references against $defs, resolving each definition only once.
 
-    Args:
-        node: The current node in the schema.
-        definitions: The definitions from the schema's $defs.
+    Injection points share the resolved definition instead of copying it. Code that
+    modifies the resolved schema must detach the nodes it changes first (see
+    _detach_schema_node) so that a change at one $ref site stays local.
+    """
 
-    Returns:
-        The node with references resolved.
-    """
-    if isinstance(node, dict):
-        if '$ref' in node:
-            ref = node['$ref']
-            if ref.startswith('#/$defs/'):
-                def_key = ref.replace('#/$defs/', '')
-                if def_key in definitions:
-                    resolved_def = copy.deepcopy(definitions[def_key])
-                    # Recursively resolve references in the resolved definition
-                    resolved_node = _resolve_refs(resolved_def, definitions)
+    def __init__(self, definitions: Dict[str, Any]) -> None:
+        self.definitions = definitions
+        self.resolved_cache: Dict[str, Any] = {}
+        self.resolving: Set[str] = set()
+
+    def resolve(self, node: Any) -> Any:
+        """
+        Recursively resolve $ref references in the given node.
+
+        Args:
+            node: The current node in the schema.
+
+        Returns:
+            The node with references resolved.
+        """
+        if isinstance(node, dict):
+            if '$ref' in node:
+                ref = node['$ref']
+                if ref.startswith('#/$defs/'):
+                    def_key = ref.replace('#/$defs/', '')
+                    resolved_def = self._resolve_definition(def_key)
+                    if len(node) == 1:
+                        return resolved_def
                     # Merge with existing keys except $ref
-                    for key, value in node.items():
-                        if key != '$ref':
-                            resolved_node[key] = value
+                    resolved_node = dict(resolved_def)
+                    resolved_node.update({k: v for k, v in node.items() if k != '$ref'})
                     return resolved_node
                 else:
-                    logging.error(f"Definition '{def_key}' not found in $defs.")
+                    logging.error(f"Unsupported $ref format: {ref}")
                     sys.exit(1)
             else:
-                logging.error(f"Unsupported $ref format: {ref}")
-                sys.exit(1)
+                return {k: self.resolve(v) for k, v in node.items()}
+        elif isinstance(node, list):
+            return [self.resolve(item) for item in node]
         else:
-            return {k: _resolve_refs(v, definitions) for k, v in node.items()}
-    elif isinstance(node, list):
-        return [_resolve_refs(item, definitions) for item in node]
-    else:
-        return node
+            return node
+
+    def _resolve_definition(self, def_key: str) -> Any:
+        """
+        Return the fully resolved definition for a $defs key, computing it on first use.
+
+        Args:
+            def_key: The key of the definition in $defs.
+
+        Returns:
+            The cached, resolved definition, shared between all of its $ref sites.
+        """
+        if def_key in self.resolved_cache:
+            return self.resolved_cache[def_key]
+        if def_key not in self.definitions:
+            logging.error(f"Definition '{def_key}' not found in $defs.")
+            sys.exit(1)
+        if def_key in self.resolving:
+            logging.error(f"Circular $ref detected for definition '{def_key}'.")
+            sys.exit(1)
+        self.resolving.add(def_key)
+        resolved = self.resolve(self.definitions[def_key])
+        self.resolving.discard(def_key)
+        self.resolved_cache[def_key] = resolved
+        return resolved
 
 
 def load_config(filename: str) -> Dict[str, Any]:
@@ -119,8 +187,8 @@ def load_config(filename: str) -> Dict[str, Any]:
     """
     logging.info(f"Loading configuration from '{filename}'...")
     try:
-        with open(os.path.join(DATA_DIR, filename), 'r') as f:
-            config = yaml.safe_load(f) or {}
+        with open(DATA_DIR / filename, 'r') as f:
+            config = yaml.load(f, Loader=_YamlLoader) or {}
         return config
     except FileNotFoundError:
         logging.error(f"File '{filename}' not found.")
@@ -130,6 +198,60 @@ def load_config(filename: str) -> Dict[str, Any]:
         sys.exit(1)
 
 
+def _is_object(node: Dict[str, Any]) -> bool:
+    """Return True if the schema node's type is or includes 'object'."""
+    t = node.get('type')
+    return t == 'object' or (type(t) is list and 'object' in t)
+
+
+def _is_array(node: Dict[str, Any]) -> bool:
+    """Return True if the schema node's type is or includes 'array'."""
+    t = node.get('type')
+    return t == 'array' or (type(t) is list and 'array' in t)
+
+
+def _detach(parent: Dict[str, Any], key: str) -> Any:
+    """
+    Replace parent[key] with a shallow copy so it can be modified without affecting
+    other $ref sites that share the same resolved node.
+
+    Args:
+        parent: A node already owned by the caller.
+        key: The key of the child to detach.
+
+    Returns:
+        The detached child.
+    """
+    child = dict(parent[key])
+    parent[key] = child
+    return child
+
+
+def _detach_schema_node(schema_node: Dict[str, Any], path_list: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Find the node at the specified path, detaching every node along the way.
+
+    Args:
+        schema_node: The current node in the schema, already owned by the caller.
+        path_list: The list of keys representing the path to the target node.
+
+    Returns:
+        The detached schema node at the specified path, or None if not found.
+    """
+    if not path_list:
+        return schema_node
+
+    key = path_list[0]
+    if _is_object(schema_node) and 'properties' in schema_node:
+        if key in schema_node['properties']:
+            props = _detach(schema_node, 'properties')
+            return _detach_schema_node(_detach(props, key), path_list[1:])
+    elif _is_array(schema_node) and 'items' in schema_node:
+        return _detach_schema_node(_detach(schema_node, 'items'), path_list)
+
+    return None
+
+
 def get_schema_node(schema_node: Dict[str, Any], path_list: List[str]) -> Optional[Dict[str, Any]]:
     """
     Navigate through the schema to find the node at the specified path.
@@ -145,16 +267,10 @@ def get_schema_node(schema_node: Dict[str, Any], path_list: List[str]) -> Option
         return schema_node
 
     key = path_list[0]
-    node_types = schema_node.get('type')
-    if isinstance(node_types, list):
-        node_types = node_types
-    else:
-        node_types = [node_types]
-
-    if 'object' in node_types and 'properties' in schema_node:
+    if _is_object(schema_node) and 'properties' in schema_node:
         if key in schema_node['properties']:
             return get_schema_node(schema_node['properties'][key], path_list[1:])
-    elif 'array' in node_types and 'items' in schema_node:
+    elif _is_array(schema_node) and 'items' in schema_node:
         return get_schema_node(schema_node['items'], path_list)
 
     return None
@@ -172,21 +288,16 @@ def del_schema_node(schema_node: Dict[str, Any], path_list: List[str]) -> None:
         return
 
     key = path_list[0]
-    node_types = schema_node.get('type')
-    if isinstance(node_types, list):
-        node_types = node_types
-    else:
-        node_types = [node_types]
-
-    if 'object' in node_types and 'properties' in schema_node:
+    if _is_object(schema_node) and 'properties' in schema_node:
         if key in schema_node['properties']:
+            props = _detach(schema_node, 'properties')
             if len(path_list) == 1:
-                del schema_node['properties'][key]
+                del props[key]
                 logging.debug(f"Deleted property '{key}'")
             else:
-                del_schema_node(schema_node['properties'][key], path_list[1:])
-    elif 'array' in node_types and 'items' in schema_node:
-        del_schema_node(schema_node['items'], path_list)
+                del_schema_node(_detach(props, key), path_list[1:])
+    elif _is_array(schema_node) and 'items' in schema_node:
+        del_schema_node(_detach(schema_node, 'items'), path_list)
 
 
 def handle_mappings(schema: Dict[str, Any], path_list: List[str], mapping_values: Dict[str, str]) -> None:
@@ -198,21 +309,15 @@ def handle_mappings(schema: Dict[str, Any], path_list: List[str], mapping_values
         path_list: The list of keys representing the path to the property.
         mapping_values: The mappings to apply.
     """
-    prop = get_schema_node(schema, path_list)
+    prop = _detach_schema_node(schema, path_list)
     if prop is None:
         logging.warning(f"Property '{'.'.join(path_list)}' not found in schema.")
         return
 
     ids = list(mapping_values.values())
-    prop_type = prop.get('type')
-    if isinstance(prop_type, list):
-        prop_types = prop_type
-    else:
-        prop_types = [prop_type]
-
-    if 'array' in prop_types:
+    if _is_array(prop):
         if 'items' in prop:
-            prop['items']['enum'] = ids
+            _detach(prop, 'items')['enum'] = ids
         else:
             logging.warning(f"'items' not found in array property '{'.'.join(path_list)}'.")
             return
@@ -224,6 +329,23 @@ def handle_mappings(schema: Dict[str, Any], path_list: List[str], mapping_values
     prop['description'] = prop.get('description', '') + "\n" + mappings_description
 
 
+def _iter_mapping_items(items: List[Union[str, Dict[str, str]]]) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (label, id) pairs from a list-style mapping configuration.
+
+    Args:
+        items: Mapping entries; a string maps to itself and a dict contributes all its pairs.
+
+    Yields:
+        The (label, id) pairs in configuration order.
+    """
+    for item in items:
+        if isinstance(item, dict):
+            yield from item.items()
+        elif isinstance(item, str):
+            yield item, item
+
+
 def modify_schema(schema: Dict[str, Any], config: Dict[str, Any]) -> None:
     """
     Modify the schema based on the configuration.
@@ -241,77 +363,76 @@ def modify_schema(schema: Dict[str, Any], config: Dict[str, Any]) -> None:
         elif isinstance(value, dict):
             handle_mappings(schema, path_list, value)
         elif isinstance(value, list):
-            mapping_values = {}
-            for item in value:
-                if isinstance(item, dict):
-                    mapping_values.update(item)
-                elif isinstance(item, str):
-                    mapping_values[item] = item
-            handle_mappings(schema, path_list, mapping_values)
+            handle_mappings(schema, path_list, dict(_iter_mapping_items(value)))
         else:
             logging.warning(f"Unsupported config value type for key '{key}'.")
 
 
-def enforce_constraints(schema: Dict[str, Any]) -> None:
+def _walk_and_finalize(root: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Enforce constraints and gather statistics in a single pass over the schema.
+
+    Every object with properties gets all of its fields marked as required and
+    'additionalProperties' set to false, while the total number of properties and
+    the maximum nesting level are accumulated.
+
+    Args:
+        root: The schema dictionary to modify.
+
+    Returns:
+        A tuple of (total_properties, max_nesting).
+    """
+    total_properties = 0
+    max_nesting = 0
+    # Subtrees shared between $ref sites only need their constraints set once
+    finalized: Set[int] = set()
+    stack = [(root, 1)]
+    while stack:
+        node, level = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if _is_object(node) and 'properties' in node:
+            props = node['properties']
+            if id(node) not in finalized:
+                finalized.add(id(node))
+                node['required'] = list(props)
+                node['additionalProperties'] = False
+            total_properties += len(props)
+            if level > max_nesting:
+                max_nesting = level
+            for prop in props.values():
+                # Scalar leaves have no properties or items to visit
+                if isinstance(prop, dict) and prop.get('type') not in SCALAR_TYPES:
+                    stack.append((prop, level + 1))
+        elif _is_array(node) and 'items' in node:
+            stack.append((node['items'], level + 1))
+    return total_properties, max_nesting
+
+
+def enforce_constraints(schema: Dict[str, Any]) -> Tuple[int, int]:
     """
     Enforce constraints on the schema by setting all fields as required and disabling additional properties.
 
     Args:
         schema: The schema dictionary to modify.
+
+    Returns:
+        A tuple of (total_properties, max_nesting) gathered during the same pass.
     """
     logging.info("Setting all fields as required...")
     logging.info("Setting 'additionalProperties' to false for all objects...")
+    return _walk_and_finalize(schema)
 
-    def set_required_and_additional_properties(node: Any) -> None:
-        if isinstance(node, dict):
-            node_type = node.get('type')
-            if isinstance(node_type, list):
-                node_types = node_type
-            else:
-                node_types = [node_type]
-
-            if 'object' in node_types and 'properties' in node:
-                props = node['properties']
-                node['required'] = list(props.keys())
-                node['additionalProperties'] = False
-                for prop in props.values():
-                    set_required_and_additional_properties(prop)
-            elif 'array' in node_types and 'items' in node:
-                set_required_and_additional_properties(node['items'])
-
-    set_required_and_additional_properties(schema)
 
-
-def calculate_statistics(schema: Dict[str, Any]) -> None:
+def report_statistics(total_properties: int, max_nesting: int) -> None:
     """
-    Calculate and report statistics about the schema.
+    Report statistics about the schema.
 
     Args:
-        schema: The schema dictionary.
+        total_properties: The total number of properties in the schema.
+        max_nesting: The maximum nesting level of the schema.
     """
     logging.info("Calculating schema statistics...")
-    total_properties = 0
-    max_nesting = 0
-
-    def traverse(node: Any, current_level: int) -> None:
-        nonlocal total_properties, max_nesting
-        if isinstance(node, dict):
-            node_type = node.get('type')
-            if isinstance(node_type, list):
-                node_types = node_type
-            else:
-                node_types = [node_type]
-
-            if 'object' in node_types and 'properties' in node:
-                props = node['properties']
-                total_properties += len(props)
-                max_nesting = max(max_nesting, current_level)
-                for prop in props.values():
-                    traverse(prop, current_level + 1)
-            elif 'array' in node_types and 'items' in node:
-                traverse(node['items'], current_level + 1)
-
-    traverse(schema, 1)
     logging.info(f"Total properties: {total_properties}")
     logging.info(f"Maximum nesting level: {max_nesting}")
     constraints_met = True
@@ -327,20 +448,88 @@ def calculate_statistics(schema: Dict[str, Any]) -> None:
         logging.info("Schema does not meet the property and nesting constraints.")
 
 
-def save_schema(schema: Dict[str, Any], original_filename: str) -> None:
+def compiled_filename(original_filename: str) -> str:
+    """
+    Return the filename of the compiled schema for a source schema filename.
+
+    Args:
+        original_filename: The original schema filename.
+
+    Returns:
+        The compiled schema filename, e.g. 'schema_compiled.json'.
+    """
+    base, ext = os.path.splitext(original_filename)
+    return f"{base}_compiled{ext}"
+
+
+def compute_build_hash(schema_filename: str, config_filename: str) -> str:
+    """
+    Fingerprint the inputs of a schema build.
+
+    The hash covers the schema, the configuration and this module's source, so a
+    change to any of them invalidates the compiled schema.
+
+    Args:
+        schema_filename: The filename of the JSON Schema.
+        config_filename: The filename of the YAML configuration.
+
+    Returns:
+        The hex SHA-256 digest of the inputs.
+    """
+    h = hashlib.sha256()
+    for path in (DATA_DIR / schema_filename, DATA_DIR / config_filename, pathlib.Path(__file__)):
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def is_build_current(schema_filename: str, config_filename: str) -> bool:
+    """
+    Check whether the compiled schema is up to date with its inputs.
+
+    The modification times are compared first so a stale build is detected without
+    reading any input; a newer output is then confirmed against the fingerprint saved
+    alongside it. Setting the FORCE_REBUILD environment variable always rebuilds.
+
+    Args:
+        schema_filename: The filename of the JSON Schema.
+        config_filename: The filename of the YAML configuration.
+
+    Returns:
+        True if the compiled schema can be reused, False if it must be rebuilt.
+    """
+    if os.getenv('FORCE_REBUILD'):
+        return False
+    output_path = DATA_DIR / compiled_filename(schema_filename)
+    hash_path = output_path.with_name(output_path.name + '.sha256')
+    try:
+        src_mtime = max(
+            (DATA_DIR / schema_filename).stat().st_mtime,
+            (DATA_DIR / config_filename).stat().st_mtime,
+            pathlib.Path(__file__).stat().st_mtime,
+        )
+        if output_path.stat().st_mtime < src_mtime:
+            return False
+        return hash_path.read_text() == compute_build_hash(schema_filename, config_filename)
+    except FileNotFoundError:
+        return False
+
+
+def save_schema(schema: Dict[str, Any], original_filename: str, build_hash: Optional[str] = None) -> None:
     """
     Save the modified schema to a new file.
 
     Args:
         schema: The modified schema dictionary.
         original_filename: The original schema filename.
+        build_hash: The fingerprint of the build inputs, saved next to the compiled schema.
     """
-    base, ext = os.path.splitext(original_filename)
-    new_filename = f"{base}_compiled{ext}"
+    new_filename = compiled_filename(original_filename)
     logging.info(f"Saving modified schema to '{new_filename}'...")
     try:
-        with open(os.path.join(DATA_DIR, new_filename), 'w') as f:
-            json.dump(schema, f, indent=2)
+        with open(DATA_DIR / new_filename, 'wb') as f:
+            f.write(_json_dumps(schema))
+        if build_hash is not None:
+            (DATA_DIR / f"{new_filename}.sha256").write_text(build_hash)
     except Exception as e:
         logging.error(f"Error saving schema: {e}")
         sys.exit(1)
@@ -350,15 +539,18 @@ def main() -> None:
     """
     Main function to process the schema and configuration.
     """
+    if is_build_current(SCHEMA_FILE, CONFIG_FILE):
+        logging.info(f"'{compiled_filename(SCHEMA_FILE)}' is up to date.")
+        return
     schema = load_schema(SCHEMA_FILE)
     schema = resolve_references(schema)
     # Remove $defs and $ref from the schema to make it self-contained
     schema.pop('$defs', None)
     config = load_config(CONFIG_FILE)
     modify_schema(schema, config)
-    enforce_constraints(schema)
-    calculate_statistics(schema)
-    save_schema(schema, SCHEMA_FILE)
+    total_properties, max_nesting = enforce_constraints(schema)
+    report_statistics(total_properties, max_nesting)
+    save_schema(schema, SCHEMA_FILE, compute_build_hash(SCHEMA_FILE, CONFIG_FILE))
     logging.info("Process completed successfully.")
 
 
@@ -1,14 +1,59 @@
 #!/usr/bin/env python3
 import argparse
+import functools
 import json
 import os
+import pathlib
 import sys
 
 import requests
 from dotenv import load_dotenv
 from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATA_DIR = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+# Shared session so Swell API calls reuse pooled keep-alive connections.
+# Only responses that mean the product was not created are retried, so a
+# retried POST cannot create a duplicate product.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=3,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=[429, 503],
+            allowed_methods=frozenset(["POST"]),
+        ),
+    ),
+)
+
+
+def _json_loads(data):
+    """Parse JSON from UTF-8 bytes or text."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        # Decode explicitly; json.loads would otherwise sniff the encoding first
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    """Serialize an object to UTF-8 JSON bytes indented by two spaces."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
 
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -26,19 +71,21 @@ def parse_arguments():
     return parser.parse_args()
 
 
+@functools.lru_cache(maxsize=4)
 def load_schema(schema_path="schema_compiled.json"):
-    """Load the JSON schema from a file."""
+    """Load the JSON schema from a file. The parsed schema is cached per path."""
     try:
-        with open(os.path.join(DATA_DIR, schema_path), "r", encoding="utf-8") as file:
-            return json.load(file)
+        with open(DATA_DIR / schema_path, "rb") as file:
+            return _json_loads(file.read())
     except FileNotFoundError:
         sys.exit(f"Error: Schema file '{schema_path}' not found.")
     except json.JSONDecodeError:
         sys.exit(f"Error: Invalid JSON in schema file '{schema_path}'.")
 
 
+@functools.lru_cache(maxsize=1)
 def load_env_variables():
-    """Load environment variables from the .env file."""
+    """Load environment variables from the .env file. The result is cached."""
     load_dotenv()
     openai_api_key = os.getenv("openai_api_key")
     store_id = os.getenv("store-id")
@@ -66,9 +113,15 @@ def read_markdown_content(mdfile):
         return sys.stdin.read()
 
 
+@functools.lru_cache(maxsize=None)
+def get_openai_client(openai_api_key):
+    """Return a shared OpenAI client so concurrent requests reuse its connection pool."""
+    return OpenAI(api_key=openai_api_key)
+
+
 def process_data_with_openai(content, schema, openai_api_key):
     """Use OpenAI API to generate structured product data from markdown content."""
-    client = OpenAI(api_key=openai_api_key)
+    client = get_openai_client(openai_api_key)
 
     messages = [
         {
@@ -121,15 +174,16 @@ def remove_null_properties(data):
         return data
 
 
-def handle_output(result, output_type, store_id=None, store_key=None):
-    """Output the result to a file, Swell API, or stdout."""
+def handle_output(result, output_type, store_id=None, store_key=None, quiet=False):
+    """Output the result to a file, Swell API, or stdout. Status messages are omitted when quiet is set."""
     result = remove_null_properties(result)
 
     if output_type == "json":
         try:
-            with open(os.path.join(DATA_DIR, "output.json"), "w", encoding="utf-8") as file:
-                json.dump(result, file, ensure_ascii=False, indent=4)
-            print("Output successfully written to 'output.json'", file=sys.stderr)
+            with open(DATA_DIR / "output.json", "wb") as file:
+                file.write(_json_dumps(result))
+            if not quiet:
+                print("Output successfully written to 'output.json'", file=sys.stderr)
         except Exception as e:
             sys.exit(f"Error writing to 'output.json': {e}")
     elif output_type == "swell":
@@ -141,27 +195,20 @@ def handle_output(result, output_type, store_id=None, store_key=None):
             "Content-Type": "application/json",
         }
         try:
-            response = requests.post(
+            response = SESSION.post(
                 "https://api.swell.store/products", headers=headers, json=result
             )
             response.raise_for_status()
-            print("Data successfully submitted to Swell API.", file=sys.stderr)
+            if not quiet:
+                print("Data successfully submitted to Swell API.", file=sys.stderr)
         except requests.RequestException as e:
             sys.exit(f"Error submitting to Swell API: {e}")
     else:
-        print(json.dumps(result, ensure_ascii=False, indent=4))
-
-
-def main(args=None):
-    if args is None:
-        args = parse_arguments()  # Default to command-line arguments if none provided
-    else:
-        pass
+        print(_json_dumps(result).decode("utf-8"))
 
-    env_vars = load_env_variables()
-    schema = load_schema()
 
-    content = read_markdown_content(args.mdfile)
+def run(content, schema, env_vars, output=None, quiet=False):
+    """Generate a product from markdown content and send it to the chosen output."""
     content = content.strip()
 
     if not content:
@@ -172,11 +219,25 @@ def main(args=None):
 
     handle_output(
         result,
-        args.output,
+        output,
         store_id=env_vars.get("store_id"),
         store_key=env_vars.get("store_key"),
+        quiet=quiet,
     )
 
 
+def main(args=None):
+    if args is None:
+        args = parse_arguments()  # Default to command-line arguments if none provided
+    else:
+        pass
+
+    env_vars = load_env_variables()
+    schema = load_schema()
+
+    content = read_markdown_content(args.mdfile)
+    run(content, schema, env_vars, output=args.output)
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
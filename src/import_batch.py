@@ -2,85 +2,193 @@
 
 import argparse
 import csv
+import io
 import json
+import logging
 import os
+import pathlib
 import re
 import shutil
 import sys
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+from tqdm.contrib.logging import logging_redirect_tqdm
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 # Import the modules
 import preprocess_source
 import generate_product
 import build_schema
 
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+DATA_DIR = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+URL_PREFIXES = ('http://', 'https://', 'ftp://')
+URL_PATTERN = re.compile(
+    r'(https?|ftp):\/\/'                   # Scheme
+    r'(?:(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,6}'  # Domain
+    r'|localhost'                         # localhost
+    r'|\d{1,3}(?:\.\d{1,3}){3})'          # or IP
+    r'(?::\d+)?'                          # Optional port
+    r'(?:\/\S*)?'                         # Path
+)
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 def process_csv_batch(batch_file):
     """Process a CSV batch file and return a list of CSV strings, each containing the header and one data row."""
     products = []
-    with open(os.path.join(DATA_DIR, batch_file), 'r', encoding='utf-8') as f:
+    with open(DATA_DIR / batch_file, 'r', encoding='utf-8') as f:
         reader = csv.reader(f)
         try:
             header = next(reader)
         except StopIteration:
-            print('Error: CSV file is empty.')
+            logging.error('Error: CSV file is empty.')
             sys.exit(1)
+        # Serialize the header once and reuse a single buffer and writer for every row
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        header_line = buffer.getvalue()
         for row in reader:
-            output = csv.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(header)
+            buffer.seek(0)
+            buffer.truncate(0)
             writer.writerow(row)
-            products.append(output.getvalue())
+            products.append(header_line + buffer.getvalue())
     return products
 
 def find_first_array(obj):
-    """Recursively find the first array in a JSON object."""
-    if isinstance(obj, list):
-        return obj
-    elif isinstance(obj, dict):
-        for value in obj.values():
-            result = find_first_array(value)
-            if result is not None:
-                return result
-        return None
-    else:
-        return None
+    """Find the first array in a JSON object using a breadth-first search, so the shallowest array wins."""
+    queue = deque([obj])
+    while queue:
+        current = queue.popleft()
+        if isinstance(current, list):
+            return current
+        if isinstance(current, dict):
+            queue.extend(current.values())
+    return None
+
+def find_first_array_prefix(f):
+    """Stream a JSON file and return the ijson prefix of the array find_first_array would pick, or None."""
+    best_prefix = None
+    best_depth = None
+    depth = 0
+    array_depth = 0  # Number of enclosing arrays; find_first_array never looks inside one
+    for prefix, event, _ in ijson.parse(f):
+        if event == 'start_array':
+            if array_depth == 0 and (best_depth is None or depth < best_depth):
+                best_prefix, best_depth = prefix, depth
+                if depth <= 1:
+                    break  # Nothing shallower can follow
+            array_depth += 1
+            depth += 1
+        elif event == 'start_map':
+            depth += 1
+        elif event == 'end_array':
+            array_depth -= 1
+            depth -= 1
+        elif event == 'end_map':
+            depth -= 1
+    return best_prefix
 
 def process_json_batch(batch_file):
     """Process a JSON batch file and return a list of JSON strings, each representing an element in the first array."""
     products = []
-    with open(os.path.join(DATA_DIR, batch_file), 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        array = find_first_array(data)
-        if array is None:
-            print('Error: No array found in JSON file.')
+    if ijson is None:
+        with open(DATA_DIR / batch_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            array = find_first_array(data)
+            if array is None:
+                logging.error('Error: No array found in JSON file.')
+                sys.exit(1)
+            for item in array:
+                product_str = json.dumps(item)
+                products.append(product_str)
+        return products
+
+    # Stream the file so only one array element is held in memory at a time
+    with open(DATA_DIR / batch_file, 'rb') as f:
+        prefix = find_first_array_prefix(f)
+        if prefix is None:
+            logging.error('Error: No array found in JSON file.')
             sys.exit(1)
-        for item in array:
-            product_str = json.dumps(item)
-            products.append(product_str)
+        f.seek(0)
+        item_prefix = f'{prefix}.item' if prefix else 'item'
+        for item in ijson.items(f, item_prefix, use_float=True):
+            products.append(json.dumps(item))
     return products
 
+def is_valid_url(url):
+    """Check that a URL has the form scheme://host[:port][/path], with no whitespace."""
+    return URL_PATTERN.fullmatch(url) is not None
+
 def process_urls_batch(batch_file):
-    """Process a TXT batch file containing URLs and return a list of valid URLs."""
+    """Process a TXT batch file containing URLs and return a list of valid URLs. Blank lines and lines starting with '#' are ignored."""
     products = []
-    url_pattern = re.compile(
-        r'^(https?|ftp):\/\/'                 # Scheme
-        r'(?:(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,6}'  # Domain
-        r'|localhost'                         # localhost
-        r'|\d{1,3}(?:\.\d{1,3}){3})'          # or IP
-        r'(?::\d+)?'                          # Optional port
-        r'(?:\/\S*)?$'                        # Path
-    )
-    with open(os.path.join(DATA_DIR, batch_file), 'r', encoding='utf-8') as f:
+    with open(DATA_DIR / batch_file, 'r', encoding='utf-8') as f:
         for line in f:
             url = line.strip()
-            if url_pattern.match(url):
+            # Skip blank lines and comments
+            if not url or url.startswith('#'):
+                continue
+            # Cheap prefix check before the full validation
+            if url.startswith(URL_PREFIXES) and is_valid_url(url):
                 products.append(url)
             else:
-                print(f'Invalid URL skipped: {url}')
+                logging.warning(f'Invalid URL skipped: {url}')
     return products
 
+def process_product(index, product, batch_type, data_dir, num_products, schema, env_vars):
+    """Preprocess and import a single product. Returns True if the product was imported."""
+    logging.debug(f'Processing product {index}/{num_products}...')
+    product_file = data_dir / str(index)
+
+    if batch_type in ('csv', 'json'):
+        # Write the product string to a file
+        with open(product_file, 'w', encoding='utf-8') as f:
+            f.write(product)
+        input_uri = f'file://{product_file.resolve()}'
+        input_type = 'text'
+    elif batch_type == 'urls':
+        input_uri = product  # The URL itself
+        input_type = 'webpage'
+
+    output_file = product_file  # Same for all types
+
+    # Prepare arguments for preprocess_source
+    preprocess_args = argparse.Namespace(
+        input_uri=input_uri,
+        input_type=input_type,
+        output_file=output_file,
+        skip_token_count=True,  # Per-product status output would break up the progress bar
+        quiet=True,
+    )
+
+    # Call preprocess_source.main(). Both modules report failures with sys.exit, so
+    # SystemExit is caught too and only skips this product
+    try:
+        preprocess_source.main(preprocess_args)
+    except (Exception, SystemExit) as e:
+        logging.error(f'Error in preprocess_source for product {index}: {e}')
+        return False  # Skip to the next product
+
+    # Generate and import the product using the schema and settings loaded once per batch
+    try:
+        content = generate_product.read_markdown_content(product_file)
+        generate_product.run(content, schema, env_vars, output='swell', quiet=True)
+        logging.debug(f'Product {index} imported successfully.')
+        return True
+    except (Exception, SystemExit) as e:
+        logging.error(f'Error in generate_product for product {index}: {e}')
+        return False  # Skip to the next product
+
 def main():
     """Main function to process the batch file and import products."""
     # Parse command-line arguments
@@ -93,8 +201,8 @@ def main():
     batch_type = args.batch_type
 
     # Validate batch file
-    if not os.path.isfile(os.path.join(DATA_DIR, batch_file)):
-        print(f'Error: The batch file "{batch_file}" does not exist or is not a file.')
+    if not (DATA_DIR / batch_file).is_file():
+        logging.error(f'Error: The batch file "{batch_file}" does not exist or is not a file.')
         sys.exit(1)
 
     # Process the batch file based on batch_type
@@ -105,89 +213,58 @@ def main():
     elif batch_type == 'urls':
         products = process_urls_batch(batch_file)
     else:
-        print(f'Error: Invalid batch type "{batch_type}".')
+        logging.error(f'Error: Invalid batch type "{batch_type}".')
         sys.exit(1)
 
     # Calculate the number of products and confirm with the user
     num_products = len(products)
-    print(f'Found {num_products} product(s) to import.')
+    logging.info(f'Found {num_products} product(s) to import.')
     proceed = input(f'Do you want to continue with processing of {num_products} product records? (y/n): ').strip().lower()
     if proceed not in ('y', 'yes'):
-        print('Operation cancelled by the user.')
+        logging.info('Operation cancelled by the user.')
         sys.exit(0)
 
     # Create the data directory
     unique_id = int(time.time())
-    data_dir = os.path.join(DATA_DIR, f'batch_{unique_id}')
+    data_dir = DATA_DIR / f'batch_{unique_id}'
     #data_dir = f'./data/batch_{unique_id}'
-    os.makedirs(data_dir, exist_ok=True)
+    data_dir.mkdir(parents=True, exist_ok=True)
 
     # Call build_schema.main()
     try:
         build_schema.main()
     except Exception as e:
-        print(f'Error in build_schema: {e}')
+        logging.error(f'Error in build_schema: {e}')
 
-    # Process each product
-    success_count = 0
-    for index, product in enumerate(products, start=1):
-        print(f'Processing product {index}/{num_products}...')
-        product_file = os.path.join(data_dir, str(index))
-
-        if batch_type in ('csv', 'json'):
-            # Write the product string to a file
-            with open(product_file, 'w', encoding='utf-8') as f:
-                f.write(product)
-            input_uri = f'file://{os.path.abspath(product_file)}'
-            input_type = 'text'
-        elif batch_type == 'urls':
-            input_uri = product  # The URL itself
-            input_type = 'webpage'
-
-        output_file = product_file  # Same for all types
-
-        # Prepare arguments for preprocess_source
-        preprocess_args = argparse.Namespace(
-            input_uri=input_uri,
-            input_type=input_type,
-            output_file=output_file
-        )
-
-        # Call preprocess_source.main()
-        try:
-            preprocess_source.main(preprocess_args)
-        except Exception as e:
-            print(f'Error in preprocess_source for product {index}: {e}')
-            continue  # Skip to the next product
-
-        # Prepare arguments for generate_product
-        generate_args = argparse.Namespace(
-            mdfile=product_file,
-            output='swell'
-        )
+    # Load the compiled schema and credentials once for the whole batch
+    schema = generate_product.load_schema()
+    env_vars = generate_product.load_env_variables()
 
-        # Call generate_product.main()
-        try:
-            generate_product.main(generate_args)
-            print(f'Product {index} imported successfully.')
-            success_count += 1
-        except Exception as e:
-            print(f'Error in generate_product for product {index}: {e}')
-            continue  # Skip to the next product
+    # Process the products concurrently; each one is dominated by network I/O
+    max_workers = int(os.getenv('BATCH_CONCURRENCY', '8'))
+    success_count = 0
+    # Log records from the workers are written above the progress bar instead of through it
+    with logging_redirect_tqdm(), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(process_product, index, product, batch_type, data_dir, num_products, schema, env_vars): index
+            for index, product in enumerate(products, start=1)
+        }
+        for future in tqdm(as_completed(futures), total=num_products, desc='Importing'):
+            success_count += bool(future.result())
 
     # Completion message
-    print(f'{success_count} out of {num_products} products were imported.')
+    logging.info(f'{success_count} out of {num_products} products were imported.')
 
     # Ask the user whether to delete interim data
     cleanup = input(f'Do you want to delete interim data at {data_dir}? (y/n): ').strip().lower()
     if cleanup in ('y', 'yes'):
         try:
             shutil.rmtree(data_dir)
-            print('Interim data deleted.')
+            logging.info('Interim data deleted.')
         except Exception as e:
-            print(f'Error deleting interim data: {e}')
+            logging.error(f'Error deleting interim data: {e}')
     else:
-        print(f'Interim data kept at {data_dir}.')
+        logging.info(f'Interim data kept at {data_dir}.')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
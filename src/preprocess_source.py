@@ -1,18 +1,34 @@
 #!/usr/bin/env python3
 import argparse
 import base64
+import functools
 import json
+import mmap
+import multiprocessing
 import os
+import pathlib
 import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from io import BytesIO
+from itertools import repeat
 
-import requests
-import tiktoken
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
-from PyPDF2 import PdfReader
+DATA_DIR = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+TOKEN_CHUNK_SIZE = 1 << 20  # Characters per chunk when tokenizing large inputs
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Bytes per read when downloading input URLs
+PDF_PAGES_PER_WORKER = 100  # Minimum pages per process when extracting PDF text in parallel
+MMAP_MIN_SIZE = 1 << 20  # Local files at least this large are memory-mapped instead of read
+
+# Browser-like headers for fetching input URLs. They are sent with the fetch only,
+# not with the Jina AI calls, whose response format depends on the Accept header.
+FETCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Safari/605.1.15',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://www.google.com/',
+}
 
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 
 class InputDataError(Exception):
     pass
@@ -25,20 +41,44 @@ def parse_arguments():
         "--input-uri",
         help="URI of the input data (file or URL). If omitted, reads from stdin.",
     )
+    parser.add_argument(
+        "--batch-manifest",
+        help="File in data folder listing input URIs, one per line, to process as a batch instead of --input-uri. "
+        "With --output-file, each result is written to that folder as '<line number>'.",
+    )
     parser.add_argument(
         "--input-type",
         required=True,
-        choices=["pdf", "text", "webpage"],
+        choices=list(INPUT_PROCESSORS),
         help="Type of the input data.",
     )
     parser.add_argument(
         "--output-file",
         help="Output destination in data folder (e.g., 'batch_01/file.md'). If omitted, outputs markdown to stdout.",
     )
+    parser.add_argument(
+        "--skip-token-count",
+        action="store_true",
+        help="Do not report the number of tokens, which avoids loading the tokenizer.",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not print status messages. Errors are still reported.",
+    )
     return parser.parse_args()
 
 
+@functools.lru_cache(maxsize=1)
 def load_env_variables():
+    """Return the Jina AI key. The result is cached."""
+    # A key set in the real environment takes precedence anyway, so .env is only read without one
+    jina_key = os.environ.get("jina-key")
+    if jina_key:
+        return jina_key
+
+    from dotenv import load_dotenv
+
     load_dotenv()
     jina_key = os.getenv("jina-key")
     if not jina_key:
@@ -46,34 +86,108 @@ def load_env_variables():
     return jina_key
 
 
+@functools.lru_cache(maxsize=None)
+def get_session():
+    """Return a shared session so repeated fetches and Jina AI calls reuse pooled keep-alive connections."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=Retry(total=3, backoff_factor=0.3))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    """Return the cl100k_base encoding used by GPT-4, building its BPE tables only once."""
+    import tiktoken
+
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def split_for_tokenizing(text, chunk_size=TOKEN_CHUNK_SIZE):
+    """Split text into chunks of at most chunk_size characters, breaking after a newline where possible."""
+    # The tokenizer never merges across a newline followed by a non-space character, so
+    # breaking there gives the same tokens as the whole text; a hard split may not
+    chunks = []
+    start = 0
+    while len(text) - start > chunk_size:
+        end = text.rfind("\n", start, start + chunk_size)
+        while end >= start and text[end + 1].isspace():
+            end = text.rfind("\n", start, end)
+        end += 1
+        if end <= start:
+            end = start + chunk_size  # No suitable newline in range, split hard
+        chunks.append(text[start:end])
+        start = end
+    chunks.append(text[start:])
+    return chunks
+
+
 def calculate_tokens(text):
-    encoding = tiktoken.encoding_for_model("gpt-4")
-    tokens = encoding.encode(text)
-    num_tokens = len(tokens)
+    """Report the number of tokens in a string, or return the token counts of a list of strings."""
+    encoding = get_encoding()
+    num_threads = os.cpu_count() or 1
+    # Special tokens are counted as plain text. Lists and large inputs are tokenized in a
+    # single batched call, which spreads the work across threads that release the GIL
+    if isinstance(text, list):
+        return [len(tokens) for tokens in encoding.encode_ordinary_batch(text, num_threads=num_threads)]
+    if len(text) > TOKEN_CHUNK_SIZE:
+        chunks = split_for_tokenizing(text)
+        num_tokens = sum(len(tokens) for tokens in encoding.encode_ordinary_batch(chunks, num_threads=num_threads))
+    else:
+        num_tokens = len(encoding.encode_ordinary(text))
     print(f"Number of tokens in input text: {num_tokens}", file=sys.stderr)
     return num_tokens
 
 
+def count_tokens_in_chunks(chunks):
+    """Pass text chunks through unchanged and report their total number of tokens once exhausted."""
+    # Chunks are encoded separately, so the total matches encoding the joined text only
+    # where each chunk ends with a newline and the next starts with a non-space character
+    encoding = get_encoding()
+    num_tokens = 0
+    for chunk in chunks:
+        num_tokens += len(encoding.encode_ordinary(chunk))
+        yield chunk
+    print(f"Number of tokens in input text: {num_tokens}", file=sys.stderr)
+
+
+def local_file_path(input_uri):
+    """Return the path of a file:// input URI, or None for other inputs."""
+    if input_uri and input_uri.startswith("file://"):
+        return input_uri[7:]
+    return None
+
+
 def read_input_data(input_uri):
-    """Read data from stdin or from the specified input URI."""
+    """Read data from stdin or from the specified input URI. Returns a bytes-like object."""
     if input_uri:
         if input_uri.startswith("file://"):
-            file_path = input_uri[7:]
-            if not os.path.exists(file_path):
-                sys.exit(f"Error: File '{file_path}' does not exist.")
-            with open(file_path, "rb") as file:
-                return file.read()
+            file_path = local_file_path(input_uri)
+            try:
+                with open(file_path, "rb") as file:
+                    # Map large files read-only so pages are loaded on demand instead of
+                    # copied up front; empty files cannot be mapped and small ones gain nothing
+                    if os.fstat(file.fileno()).st_size < MMAP_MIN_SIZE:
+                        return file.read()
+                    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                raise InputDataError(f"File '{file_path}' does not exist.")
         elif input_uri.startswith(("http://", "https://")):
+            import requests
+
             try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Safari/605.1.15',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                    'Referer': 'https://www.google.com/',
-                }
-                response = requests.get(input_uri, headers=headers, timeout=10)
-                response.raise_for_status()
-                return response.content
+                with get_session().get(input_uri, headers=FETCH_HEADERS, timeout=10, stream=True) as response:
+                    response.raise_for_status()
+                    # Grow a single buffer instead of joining a list of chunks into a second copy
+                    data = bytearray()
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        data += chunk
+                    return data
             except requests.RequestException as e:
                 raise InputDataError(f"Error fetching URL '{input_uri}': {e}") from e
         else:
@@ -84,86 +198,285 @@ def read_input_data(input_uri):
         return sys.stdin.buffer.read()
 
 
+def json_bytes(obj):
+    """Serialize an object to compact UTF-8 JSON bytes, using orjson when it is installed."""
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(obj).encode("utf-8")
+    return orjson.dumps(obj)
+
+
+def build_pdf_payload(input_uri, data):
+    """Build the Jina AI JSON body for a PDF as bytes."""
+    # Base64 is plain ASCII and never needs JSON escaping, so splice it in as bytes
+    # instead of decoding it to str and serializing it again
+    head = b'{"url": ' + json_bytes(input_uri) + b', "pdf": "'
+    return b"".join((head, base64.b64encode(data), b'"}'))
+
+
+def open_pdf(source):
+    """Open a PDF with PyMuPDF from a file path or from bytes."""
+    import pymupdf
+
+    if isinstance(source, str):
+        return pymupdf.open(source, filetype="pdf")
+    return pymupdf.open(stream=source, filetype="pdf")
+
+
+def extract_pdf_page_range(source, start, stop):
+    """Extract the text of pages start..stop-1 of a PDF. Runs in a worker process."""
+    with open_pdf(source) as doc:
+        return [doc.load_page(i).get_text("text") for i in range(start, stop)]
+
+
+def extract_pdf_text_parallel(source, page_count, workers):
+    """Yield the text of every page of a PDF, extracted across worker processes, in page order."""
+    # PyMuPDF is not thread-safe, so pages are split into contiguous ranges and each
+    # process opens its own copy of the document
+    bounds = [page_count * i // workers for i in range(workers + 1)]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        # Each range is yielded as soon as it and the ranges before it are done
+        for part in executor.map(extract_pdf_page_range, repeat(source), bounds[:-1], bounds[1:]):
+            yield from part
+
+
+def iter_pdf_text(data, file_path=None):
+    """Yield the text of a local PDF page by page, with separators, so it can be written as it is extracted."""
+    # PyMuPDF extracts text in C; PyPDF2 is used as a fallback. Local files are opened
+    # by path, which PyMuPDF reads on demand and which worker processes can reopen
+    # without the document being pickled to them
+    source = file_path if file_path is not None else bytes(data)
+    try:
+        try:
+            import pymupdf
+        except ImportError:
+            pymupdf = None
+        if pymupdf is not None:
+            with open_pdf(source) as doc:
+                workers = min(os.cpu_count() or 1, doc.page_count // PDF_PAGES_PER_WORKER)
+                if workers < 2:
+                    # Each separator is yielded with the page before it, so a newline run is
+                    # never split between chunks and counting them separately stays exact
+                    last = doc.page_count - 1
+                    for index, page in enumerate(doc):
+                        text = page.get_text("text")
+                        yield text + "\n" if index < last else text
+                    return
+                page_count = doc.page_count
+            for index, text in enumerate(extract_pdf_text_parallel(source, page_count, workers)):
+                yield text + "\n" if index < page_count - 1 else text
+            return
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(file_path if file_path is not None else BytesIO(source))
+        for page in reader.pages:
+            yield page.extract_text()
+    except Exception as e:
+        sys.exit(f"Error reading PDF data: {e}")
+
+
 def process_pdf(data, is_remote=False, jina_key=None, input_uri=None):
     """Extract text from a PDF file."""
     if is_remote:
         # Use Jina AI for remote PDF processing
-        pdf_base64 = base64.b64encode(data).decode("utf-8")
+        import requests
+
         headers = {
             "Content-Type": "application/json",
             "X-With-Generated-Alt": "true",
             "Authorization": f"Bearer {jina_key}",
         }
-        payload = {"url": input_uri, "pdf": pdf_base64}
+        body = build_pdf_payload(input_uri, data)
         try:
-            response = requests.post("https://r.jina.ai/", headers=headers, json=payload)
+            response = get_session().post("https://r.jina.ai/", headers=headers, data=body)
             response.raise_for_status()
             return response.text  # Assuming markdown text is returned
         except requests.RequestException as e:
             sys.exit(f"Error processing PDF with Jina AI: {e}")
     else:
-        # Local PDF processing using PyPDF2
-        try:
-            reader = PdfReader(BytesIO(data))
-            text = "".join(page.extract_text() for page in reader.pages)
-            return text
-        except Exception as e:
-            sys.exit(f"Error reading PDF data: {e}")
+        # Local PDF processing
+        return "".join(iter_pdf_text(data, local_file_path(input_uri)))
 
 
 def process_webpage(data, is_remote=False, jina_key=None, input_uri=None):
     """Extract text from a webpage."""
     if is_remote:
         # Use Jina AI for remote webpage processing
+        import requests
+
         headers = {
             "Content-Type": "application/json",
             "X-With-Generated-Alt": "true",
             "Authorization": f"Bearer {jina_key}",
         }
-        payload = {"url": input_uri}
+        body = json_bytes({"url": input_uri})
         try:
-            response = requests.post("https://r.jina.ai/", headers=headers, json=payload)
+            response = get_session().post("https://r.jina.ai/", headers=headers, data=body)
             response.raise_for_status()
             return response.text  # Assuming markdown text is returned
         except requests.RequestException as e:
             sys.exit(f"Error processing webpage with Jina AI: {e}")
     else:
-        # Local webpage processing using BeautifulSoup
-        soup = BeautifulSoup(data, "html.parser")
+        # Local webpage processing using selectolax (lexbor), which extracts text in C.
+        # lexbor does not read <meta charset>, so only UTF-8 pages take this path and
+        # others are parsed from bytes below
+        try:
+            from selectolax.lexbor import LexborHTMLParser
+        except ImportError:
+            LexborHTMLParser = None
+        if LexborHTMLParser is not None:
+            try:
+                html = str(data, "utf-8")  # Memory-mapped input has no .decode
+            except UnicodeDecodeError:
+                html = None
+            if html is not None:
+                tree = LexborHTMLParser(html)
+                for node in tree.css("script, style, template"):
+                    node.decompose()
+                return tree.root.text(separator="\n") if tree.root is not None else ""
+
+        # Other encodings are parsed from bytes by lxml, whose libxml2 parser reads
+        # <meta charset> natively instead of BeautifulSoup's Python-level sniffing
+        try:
+            import lxml.html
+            from lxml import etree
+        except ImportError:
+            lxml = None
+        if lxml is not None:
+            try:
+                tree = lxml.html.document_fromstring(bytes(data))
+            except etree.ParserError:
+                tree = None  # Empty document, left to BeautifulSoup
+            if tree is not None:
+                etree.strip_elements(tree, etree.Comment, "script", "style", "template", with_tail=False)
+                return "\n".join(tree.itertext())
+
+        # Fall back to BeautifulSoup, which only accepts bytes or str. Its lxml tree
+        # builder parses in C; the pure-Python parser is used when lxml is missing
+        from bs4 import BeautifulSoup
+
+        try:
+            import lxml  # noqa: F401
+            html_parser = "lxml"
+        except ImportError:
+            html_parser = "html.parser"
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        soup = BeautifulSoup(data, html_parser)
         text = soup.get_text(separator="\n")
         return text
 
 
-def process_text(data):
-    """Process plain text data."""
-    return data.decode("utf-8")
+def process_text(data, is_remote=False, jina_key=None, input_uri=None):
+    """Process plain text data. Takes the same arguments as the other processors but only needs the data."""
+    return str(data, "utf-8")
+
+
+# Processor for each input type, all called with the same arguments
+INPUT_PROCESSORS = {
+    "pdf": process_pdf,
+    "text": process_text,
+    "webpage": process_webpage,
+}
 
 
 def process_input_data(input_type, data, is_remote=False, jina_key=None, input_uri=None):
     """Process input data based on the input type."""
-    if input_type == "pdf":
-        return process_pdf(data, is_remote=is_remote, jina_key=jina_key, input_uri=input_uri)
-    elif input_type == "webpage":
-        return process_webpage(data, is_remote=is_remote, jina_key=jina_key, input_uri=input_uri)
-    elif input_type == "text":
-        return process_text(data)
-    else:
+    try:
+        processor = INPUT_PROCESSORS[input_type]
+    except KeyError:
         sys.exit(f"Error: Unsupported input type '{input_type}'.")
+    return processor(data, is_remote=is_remote, jina_key=jina_key, input_uri=input_uri)
+
+
+def is_output_path(file_path, output_option):
+    """Return True if the output destination is the given local file."""
+    if not output_option:
+        return False
+    return (DATA_DIR / output_option).resolve() == pathlib.Path(file_path).resolve()
 
 
-def handle_output(markdown_text, output_option):
-    """Output the markdown text to a file or stdout."""
+def handle_output(markdown_text, output_option, quiet=False):
+    """Output the markdown text (str, UTF-8 bytes, or an iterator of str chunks) to a file or stdout."""
+    # Encode once and write bytes, skipping the text-mode encoding layer
+    if isinstance(markdown_text, str):
+        chunks = (markdown_text.encode("utf-8"),)
+    elif isinstance(markdown_text, Iterator):
+        chunks = (chunk.encode("utf-8") for chunk in markdown_text)
+    else:
+        chunks = (markdown_text,)
     if output_option:
-        output_path = os.path.join(DATA_DIR, output_option)
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        output_path = DATA_DIR / output_option
+        output_path.parent.mkdir(parents=True, exist_ok=True)
         try:
-            with open(output_path, "w", encoding="utf-8") as file:
-                file.write(markdown_text)
-            print(f"Output successfully written to '{output_option}'", file=sys.stderr)
+            with open(output_path, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            if not quiet:
+                print(f"Output successfully written to '{output_option}'", file=sys.stderr)
         except Exception as e:
             sys.exit(f"Error writing to '{output_option}': {e}")
+    elif hasattr(sys.stdout, "buffer"):
+        sys.stdout.flush()
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.write(b"\n")
+        sys.stdout.buffer.flush()
     else:
-        print(markdown_text)
+        print("".join(str(chunk, "utf-8") for chunk in chunks))
+
+
+def read_manifest(manifest_file):
+    """Read the input URIs listed in a manifest file, skipping blank lines and comments."""
+    try:
+        with open(DATA_DIR / manifest_file, "r", encoding="utf-8") as file:
+            return [
+                (line_number, line.strip())
+                for line_number, line in enumerate(file, start=1)
+                if line.strip() and not line.lstrip().startswith("#")
+            ]
+    except FileNotFoundError:
+        sys.exit(f"Error: Manifest file '{manifest_file}' does not exist.")
+
+
+def preprocess_uri(input_uri, input_type, jina_key):
+    """Read and process a single input URI, returning its text or None if it failed."""
+    try:
+        data = read_input_data(input_uri)
+    except InputDataError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return None
+    is_remote = input_uri.startswith(("http://", "https://"))
+    try:
+        return process_input_data(input_type, data, is_remote=is_remote, jina_key=jina_key, input_uri=input_uri)
+    except SystemExit as e:
+        # Processing failures are reported with sys.exit; skip only this input
+        print(e.code if isinstance(e.code, str) else f"Error processing '{input_uri}'.", file=sys.stderr)
+        return None
+
+
+def process_manifest(args):
+    """Process every input URI in a manifest, fetching concurrently and tokenizing the results in one batch."""
+    entries = read_manifest(args.batch_manifest)
+    has_remote = any(uri.startswith(("http://", "https://")) for _, uri in entries)
+    jina_key = load_env_variables() if has_remote else None
+
+    # Fetches and Jina AI calls share the pooled session, so run them concurrently
+    max_workers = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        contents = list(executor.map(preprocess_uri, (uri for _, uri in entries), repeat(args.input_type), repeat(jina_key)))
+
+    results = [(line_number, uri, content) for (line_number, uri), content in zip(entries, contents) if content is not None]
+    if not getattr(args, "skip_token_count", False):
+        token_counts = calculate_tokens([content for _, _, content in results])
+        for (_, uri, _), num_tokens in zip(results, token_counts):
+            print(f"Number of tokens in '{uri}': {num_tokens}", file=sys.stderr)
+
+    for line_number, _, content in results:
+        output_file = pathlib.Path(args.output_file) / str(line_number) if args.output_file else None
+        handle_output(content, output_file, quiet=getattr(args, "quiet", False))
 
 
 def main(args=None):
@@ -172,16 +485,39 @@ def main(args=None):
     else:
         pass
     
+    if getattr(args, "batch_manifest", None):
+        process_manifest(args)
+        return
+
     jina_key = load_env_variables() if args.input_uri and args.input_uri.startswith(("http://", "https://")) else None
 
-    try:
-        data = read_input_data(args.input_uri)
-    except InputDataError as e:
-        print(f"Error: {e}", file=sys.stderr)
-        sys.exit(1)
+    file_path = local_file_path(args.input_uri)
+    if args.input_type == "pdf" and file_path is not None:
+        # Local PDFs are opened by path as their pages are extracted, so the file is not read here
+        if not os.path.isfile(file_path):
+            print(f"Error: File '{file_path}' does not exist.", file=sys.stderr)
+            sys.exit(1)
+        data = None
+    else:
+        try:
+            data = read_input_data(args.input_uri)
+        except InputDataError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
 
     is_remote = args.input_uri.startswith(("http://", "https://")) if args.input_uri else False
 
+    if args.input_type == "pdf" and not is_remote:
+        # Write local PDF text page by page instead of joining the whole document first
+        content = iter_pdf_text(data, file_path)
+        if not getattr(args, "skip_token_count", False):
+            content = count_tokens_in_chunks(content)
+        if file_path is not None and is_output_path(file_path, args.output_file):
+            # Opening the output truncates it, so the input must be fully extracted first
+            content = "".join(content)
+        handle_output(content, args.output_file, quiet=getattr(args, "quiet", False))
+        return
+
     content = process_input_data(
         input_type=args.input_type,
         data=data,
@@ -190,8 +526,15 @@ def main(args=None):
         input_uri=args.input_uri,
     )
 
-    calculate_tokens(content)
-    handle_output(content, args.output_file)
+    if not getattr(args, "skip_token_count", False):
+        calculate_tokens(content)
+    # Plain text input was already validated as UTF-8 by decoding it, so write the
+    # original bytes rather than encoding the decoded copy again. A memory-mapped input
+    # is never written back, since the output may be the same file and opening it
+    # truncates the data behind the mapping
+    if args.input_type == "text" and not isinstance(data, mmap.mmap):
+        content = data
+    handle_output(content, args.output_file, quiet=getattr(args, "quiet", False))
 
 
 if __name__ == "__main__":